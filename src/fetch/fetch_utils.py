@@ -3,6 +3,7 @@ import hashlib
 import json
 import logging
 import os
+import tempfile
 from typing import Iterable
 
 import aiohttp
@@ -10,6 +11,19 @@ import pdf2doi
 import providers.scidb as scidb
 import providers.scihub as scihub
 
+logger = logging.getLogger(__name__)
+
+# fail fast on PDF hosts that can't be reached, without limiting how long a
+# large PDF may take to download
+CONNECT_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=8)
+
+# the mode a plain open() would give new files. The umask can only be read by
+# setting it, so read it once at import, before any other threads are writing
+# files, instead of on every save.
+_umask = os.umask(0)
+os.umask(_umask)
+SAVED_FILE_MODE = 0o666 & ~_umask
+
 all_providers = [
     "scihub",
     "scidb",
@@ -40,10 +54,10 @@ async def get_urls(session, identifier, providers):
         return urls
 
     providers = [provider.strip() for provider in providers.split(",")]
-    logging.info(f"given providers: {providers}")
+    logger.info("given providers: %s", providers)
 
     matching_providers = match_available_providers(providers)
-    logging.info(f"matching providers: {matching_providers}")
+    logger.info("matching providers: %s", matching_providers)
     for mp in matching_providers:
         if mp == "scihub":
             urls.extend(await scihub.get_direct_urls(session, identifier))
@@ -55,9 +69,9 @@ async def get_urls(session, identifier, providers):
     # user input, only search those
     if "scihub" not in providers:
         matching_scihub_urls = match_available_providers(
-            providers, await scihub.SciHub.get_available_scihub_urls()
+            providers, await scihub.get_available_scihub_urls()
         )
-        logging.info(f"matching scihub urls: {matching_scihub_urls}")
+        logger.info("matching scihub urls: %s", matching_scihub_urls)
         if len(matching_scihub_urls) > 0:
             urls.extend(
                 await scihub.get_direct_urls(
@@ -71,43 +85,77 @@ async def get_urls(session, identifier, providers):
 async def fetch(session, identifier, providers):
     async def get_wrapper(url):
         try:
-            return await session.get(url)
+            return await session.get(url, timeout=CONNECT_TIMEOUT)
         except Exception as e:
-            logging.error("error: %s" % e)
+            logger.error("error: %s", e)
             return None
 
     urls = await get_urls(session, identifier, providers)
 
-    logging.info("urls: %s" % urls)
-    tasks = [get_wrapper(url) for url in urls if url]
-    for item in zip(asyncio.as_completed(tasks), urls):
-        res = await item[0]
-        if res is None or res.content_type != "application/pdf":
-            logging.info("couldn't find url at %s" % item[1])
-            continue
-        return await res.read()
-    return None
-
-
-def save(data, path):
+    logger.info("urls: %s", urls)
+    tasks = [asyncio.create_task(get_wrapper(url)) for url in urls if url]
+    pdf_res = None
+    try:
+        for next_res in asyncio.as_completed(tasks):
+            res = await next_res
+            if res is None:
+                continue
+            if res.content_type != "application/pdf":
+                logger.info("couldn't find url at %s", res.url)
+                # hand the connection back to the pool for the next request
+                res.release()
+                continue
+            pdf_res = res
+            break
+    finally:
+        # stop the requests we no longer need, and release any responses that
+        # came in before we stopped looking
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in tasks:
+            if task.cancelled():
+                continue
+            res = task.result()
+            if res is not None and res is not pdf_res:
+                res.release()
+
+    return pdf_res
+
+
+async def save(res, out_dir) -> str:
     """
-    Save a file give data and a path.
+    Stream the body of a PDF response to a file in out_dir, named after a hash
+    of its contents. Returns the path of the saved file.
     """
+    pdf_hash = hashlib.blake2b(digest_size=8)
+    fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=out_dir)
     try:
-        logging.info(f"Saving file to {path}")
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in res.content.iter_chunked(65536):
+                pdf_hash.update(chunk)
+                f.write(chunk)
 
-        with open(path, "wb") as f:
-            f.write(data)
+        # mkstemp creates the file as 0600; give it the usual umask-based mode
+        os.chmod(tmp_path, SAVED_FILE_MODE)
+
+        path = os.path.join(out_dir, generate_name(pdf_hash))
+        logger.info("Saving file to %s", path)
+        os.replace(tmp_path, path)
     except Exception as e:
-        logging.error(f"Failed to write to {path} {e}")
+        logger.error("Failed to write to %s %s", out_dir, e)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
         raise e
 
+    return path
+
 
-def generate_name(content):
-    "Generate unique filename for paper"
+def generate_name(pdf_hash) -> str:
+    "Generate unique filename for paper from a hash of its contents"
 
-    pdf_hash = hashlib.md5(content).hexdigest()
-    return f"{pdf_hash}" + ".pdf"
+    return f"{pdf_hash.hexdigest()}" + ".pdf"
 
 
 def rename(out_dir, path, name=None) -> str:
@@ -117,7 +165,7 @@ def rename(out_dir, path, name=None) -> str:
     successful, or the original path if not.
     """
 
-    logging.info("Finding paper title")
+    logger.info("Finding paper title")
     pdf2doi.config.set("verbose", False)
 
     try:
@@ -130,10 +178,10 @@ def rename(out_dir, path, name=None) -> str:
             name += ".pdf"
             new_path = os.path.join(out_dir, name)
             os.rename(path, new_path)
-            logging.info(f"File renamed to {new_path}")
+            logger.info("File renamed to %s", new_path)
             return new_path
         else:
             return path
     except Exception as e:
-        logging.error(f"Couldn't get paper title from PDF at {path}: {e}")
+        logger.error("Couldn't get paper title from PDF at %s: %s", path, e)
         return path
@@ -1,48 +1,122 @@
 import argparse
 import asyncio
 import logging
-import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
 
 import aiohttp
 from fetch import fetch_utils
-from parse.parse import format_output, id_patterns, parse_file, parse_ids_from_text
+from parse.parse import (
+    format_lines,
+    id_patterns,
+    parse_file,
+    parse_ids_from_chunks,
+    read_chunks,
+)
+
+logger = logging.getLogger(__name__)
 
 supported_fetch_identifier_types = ["doi", "pmid", "url", "isbn"]
 
+# connection pool limits shared by all concurrent downloads
+MAX_CONNECTIONS = 16
+MAX_CONNECTIONS_PER_HOST = 8
+
 
-def parse_ids(args) -> str:
+def parse_ids(args) -> Iterator[str]:
     # if a path isn't passed or is empty, read from stdin
     if not (hasattr(args, "path") and args.path):
-        return format_output(parse_ids_from_text(sys.stdin.read(), args.query))
+        ids = parse_ids_from_chunks(read_chunks(sys.stdin), args.match)
+    else:
+        ids = parse_file(args.path, args.match)
+
+    return format_lines(ids, args.format)
+
+
+async def fetch_one(
+    sess, identifier, providers, out, semaphore, rename_executor
+) -> str | None:
+    "Download a single paper and return its path, or None if it wasn't found."
 
-    return format_output(parse_file(args.path, args.match), args.format)
+    try:
+        async with semaphore:
+            res = await fetch_utils.fetch(sess, identifier, providers)
+            if res is None:
+                return None
+            path = await fetch_utils.save(res, out)
+    except Exception as e:
+        logger.error("Failed to fetch %s: %s", identifier, e)
+        return None
+
+    # renaming parses the PDF and looks up its title, so keep it off the event
+    # loop to avoid stalling the other downloads. pdf2doi isn't thread-safe, so
+    # every rename goes through the same single worker thread.
+    loop = asyncio.get_running_loop()
+    new_path = await loop.run_in_executor(
+        rename_executor, fetch_utils.rename, out, path
+    )
+    return new_path
 
 
-async def fetch(args):
+async def fetch(args) -> list[str]:
     providers = args.providers
-    id = args.query
     out = args.output
 
+    # if no identifiers are passed, read them from stdin, one per line
+    ids = args.query
+    if not ids:
+        ids = [line.strip() for line in sys.stdin if line.strip()]
+
     headers = None
     if args.user_agent is not None:
         headers = {
             "User-Agent": args.user_agent,
         }
 
-    async with aiohttp.ClientSession(headers=headers) as sess:
-        pdf_content = await fetch_utils.fetch(
-            sess,
-            id,
-            providers,
-        )
+    # one pooled connector for every download, so landing page and PDF requests
+    # to the same host reuse connections instead of opening new ones
+    connector = aiohttp.TCPConnector(
+        limit=MAX_CONNECTIONS,
+        limit_per_host=MAX_CONNECTIONS_PER_HOST,
+        ttl_dns_cache=300,
+    )
+    semaphore = asyncio.Semaphore(args.concurrency)
+    with ThreadPoolExecutor(max_workers=1) as rename_executor:
+        async with aiohttp.ClientSession(headers=headers, connector=connector) as sess:
+            paths = await asyncio.gather(
+                *(
+                    fetch_one(sess, id, providers, out, semaphore, rename_executor)
+                    for id in ids
+                )
+            )
+
+    return [path for path in paths if path]
+
+
+def positive_int(value: str) -> int:
+    "An argparse type for integers of at least 1"
+
+    try:
+        n = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {n}")
+    return n
 
-    if pdf_content is None:
-        return None
-    path = os.path.join(out, fetch_utils.generate_name(pdf_content))
-    fetch_utils.save(pdf_content, path)
-    new_path = fetch_utils.rename(out, path)
-    return new_path
+
+def write_lines(lines: Iterable[str]) -> bool:
+    """
+    Write lines to stdout as they're produced, rather than building the whole
+    output first. Returns whether anything was written.
+    """
+
+    wrote = False
+    for line in lines:
+        sys.stdout.write(line + "\n")
+        wrote = True
+    return wrote
 
 
 async def main():
@@ -66,14 +140,15 @@ async def main():
 
     # FETCH
     parser_fetch = subparsers.add_parser(
-        "fetch", help="try to download a paper with the given identifier"
+        "fetch", help="try to download papers with the given identifiers"
     )
 
     parser_fetch.add_argument(
         "query",
         metavar="(DOI|PMID|URL)",
         type=str,
-        help="the identifier to try to download",
+        nargs="*",
+        help="the identifiers to try to download (read from stdin if omitted)",
     )
 
     parser_fetch.add_argument(
@@ -93,6 +168,15 @@ async def main():
         type=str,
     )
 
+    parser_fetch.add_argument(
+        "-c",
+        "--concurrency",
+        metavar="n",
+        help="the maximum number of papers to download at once",
+        default=4,
+        type=positive_int,
+    )
+
     parser_fetch.add_argument(
         "-A",
         "--user-agent",
@@ -146,10 +230,8 @@ async def main():
         else:
             result = args.func(args)
 
-        if result:
-            print(result)
-        else:
-            print("No papers found")
+        if not write_lines(result):
+            print("No papers found", file=sys.stderr)
     else:
         parser.print_help()
 
@@ -1,67 +1,73 @@
+import functools
 import json
 import re
 import logging
-from bs4 import BeautifulSoup
+from typing import Iterable, Iterator
+from selectolax.lexbor import LexborHTMLParser
+
+from parse.patterns import compiled_id_patterns, id_literals, id_patterns
+
+logger = logging.getLogger(__name__)
 
 
 # from https://isbn-checker.netlify.app
+isbn_regex = re.compile(
+    r"^(?:ISBN(?:-1[03])?:? )?(?=[0-9X]{10}$|(?=(?:[0-9]+[- ]){3})[- 0-9X]{13}$|97[89][0-9]{10}$|(?=(?:[0-9]+[- ]){4})[- 0-9]{17}$)(?:97[89][- ]?)?[0-9]{1,5}[- ]?[0-9]+[- ]?[0-9]+[- ]?[0-9X]$"
+)
+isbn_prefix_regex = re.compile(r"^ISBN(?:-1[03])?:?")
+isbn_separators = str.maketrans("", "", "- ")
+
+# check digit weights for the first 9 (ISBN-10) or 12 (ISBN-13) digits
+isbn10_weights = (10, 9, 8, 7, 6, 5, 4, 3, 2)
+isbn13_weights = (1, 3) * 6
+
+# check digit characters, indexed by check value
+isbn10_check_digits = "0123456789X"
+isbn13_check_digits = "0123456789"
+
+
 def valid_isbn(subject):
     "Check if the subject is a valid ISBN"
 
-    isbn_regex = re.compile(
-        r"^(?:ISBN(?:-1[03])?:? )?(?=[0-9X]{10}$|(?=(?:[0-9]+[- ]){3})[- 0-9X]{13}$|97[89][0-9]{10}$|(?=(?:[0-9]+[- ]){4})[- 0-9]{17}$)(?:97[89][- ]?)?[0-9]{1,5}[- ]?[0-9]+[- ]?[0-9]+[- ]?[0-9X]$"
-    )
-
     # Check if the subject matches the ISBN pattern
-    if isbn_regex.match(subject):
-        chars = re.sub(r"[- ]|^ISBN(?:-1[03])?:?", "", subject)
-        chars = list(chars)
-        last = chars.pop()
-        sum = 0
-        check = 0
-
-        if len(chars) == 9:
-            chars.reverse()
-            for i in range(len(chars)):
-                sum += (i + 2) * int(chars[i])
-            check = 11 - (sum % 11)
-            if check == 10:
-                check = "X"
-            elif check == 11:
-                check = "0"
-        else:
-            for i in range(len(chars)):
-                sum += (i % 2 * 2 + 1) * int(chars[i])
-            check = 10 - (sum % 10)
-            if check == 10:
-                check = "0"
+    if not isbn_regex.match(subject):
+        return False
 
-        if str(check) == last:
-            return True
-        else:
-            return False
+    chars = isbn_prefix_regex.sub("", subject).translate(isbn_separators)
+    digits, last = chars[:-1], chars[-1]
+
+    if len(digits) == 9:
+        total = sum(w * int(d) for w, d in zip(isbn10_weights, digits))
+        check = isbn10_check_digits[-total % 11]
     else:
+        total = sum(w * int(d) for w, d in zip(isbn13_weights, digits))
+        check = isbn13_check_digits[-total % 10]
+
+    return check == last
+
+
+# the characters allowed in a DOI by the first DOI pattern
+doi_chars = str.maketrans(
+    "", "", "-._;()/:0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+)
+
+
+def is_doi(subject) -> bool:
+    "Check if the subject is a DOI, and nothing else"
+
+    # this rejects most non-DOIs without running any regex
+    if len(subject) < 8 or not subject.startswith("10."):
         return False
 
+    # most DOIs only use the common character set, so try the main pattern
+    # first and only fall back to the rarer patterns for the rest
+    if not subject.translate(doi_chars):
+        if compiled_id_patterns["doi"][0].fullmatch(subject):
+            return True
+    return any(regex.fullmatch(subject) for regex in compiled_id_patterns["doi"][1:])
 
-# these are the currently supported identifier types that we can parse, along
-# with their regex patterns
-id_patterns = {
-    # These come from https://gist.github.com/oscarmorrison/3744fa216dcfdb3d0bcb
-    "isbn": [
-        r"(?:ISBN(?:-10)?:?\ )?(?=[0-9X]{10}|(?=(?:[0-9]+[-\ ]){3})[-\ 0-9X]{13})[0-9]{1,5}[-\ ]?[0-9]+[-\ ]?[0-9]+[-\ ]?[0-9X]",
-        r"(?:ISBN(?:-13)?:?\ )?(?=[0-9]{13}|(?=(?:[0-9]+[-\ ]){4})[-\ 0-9]{17})97[89][-\ ]?[0-9]{1,5}[-\ ]?[0-9]+[-\ ]?[0-9]+[-\ ]?[0-9]",
-    ],
-    # doi regexes taken from https://www.crossref.org/blog/dois-and-matching-regular-expressions/
-    # listed in decreasing order of goodness. Not fully tested yet.
-    "doi": [
-        r"10.\d{4,9}\/[-._;()\/:A-Z0-9]+",
-        r"10.1002\/[^\s]+",
-        r"10.\d{4}\/\d+-\d+X?(\d+)\d+<[\d\w]+:[\d\w]*>\d+.\d+.\w+;\d",
-        r"10.1021\/\w\w\d++",
-        r"10.1207/[\w\d]+\&\d+_\d+",
-    ],
-}
+
+pdf_object_regex = re.compile(r'PDFObject\.embed\("([^"]+)"')
 
 # these can eliminate false positives
 # TODO: remove duplication of validation logic and parsing logic
@@ -70,52 +76,95 @@ id_validators = {
 }
 
 
-def find_pdf_url(html_content) -> str | None:
-    "Given HTML content, find an embedded link to a PDF."
+def find_pdf_url(html_content: bytes | str) -> str | None:
+    """
+    Given HTML content, find an embedded link to a PDF. The content can be
+    passed as raw bytes, without decoding it first.
+    """
 
-    s = BeautifulSoup(html_content, "html.parser")
+    tree = LexborHTMLParser(html_content)
 
     # look for a dynamically loaded PDF
-    script_element = s.find("script", string=re.compile("PDFObject.embed"))
-
-    if script_element:
-        match = re.search(r'PDFObject\.embed\("([^"]+)"', script_element.string)
+    for script_element in tree.css("script"):
+        script = script_element.text()
+        if "PDFObject.embed" not in script:
+            continue
+        match = pdf_object_regex.search(script)
         if match:
-            logging.info("found dynamically loaded PDF")
+            logger.info("found dynamically loaded PDF")
             return match.group(1)
 
     # look for the "<embed>" element (scihub)
-    embed_element = s.find("embed", {"id": "pdf", "type": "application/pdf"})
+    embed_element = tree.css_first('embed#pdf[type="application/pdf"]')
 
     if embed_element:
-        direct_url = embed_element["src"]
-        if isinstance(direct_url, list):
-            direct_url = direct_url[0]
+        direct_url = embed_element.attributes.get("src")
         if direct_url:
-            logging.info("found embedded PDF")
+            logger.info("found embedded PDF")
             return direct_url
 
     # look for an iframe
-    iframe = s.find("iframe", {"type": "application/pdf"})
+    iframe = tree.css_first('iframe[type="application/pdf"]')
 
     if iframe:
-        logging.info(f"found iframe: {iframe}")
-        direct_url = iframe.get("src")
-        if isinstance(direct_url, list):
-            direct_url = direct_url[0]
+        # serializing the node isn't free, so only do it if it will be logged
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("found iframe: %s", iframe.html)
+        direct_url = iframe.attributes.get("src")
         if direct_url:
-            logging.info("found iframe")
+            logger.info("found iframe")
             return direct_url
 
-    logging.info("No direct link to PDF found")
+    logger.info("No direct link to PDF found")
     return None
 
 
-def parse_ids_from_text(
-    s: str, id_types: list[str] | None = None
+@functools.lru_cache(maxsize=8)
+def scan_plan(
+    id_types: tuple[str, ...],
+) -> tuple[tuple[str, str | None, tuple[re.Pattern, ...]], ...]:
+    """
+    Resolve the prefilter literal and compiled patterns of each given id type
+    once, so repeated scans for the same id types (e.g. every chunk of a file)
+    reuse them.
+    """
+
+    return tuple(
+        (id_type, id_literals.get(id_type), tuple(compiled_id_patterns[id_type]))
+        for id_type in id_types
+    )
+
+
+def scan_ids(
+    s: str, id_types: list[str], stop: int | None = None
+) -> Iterator[tuple[str, str]]:
+    """
+    Scan a string for the given id types, yielding each raw hit along with
+    the id type of the pattern that produced it. Hits are not validated or
+    deduplicated. If stop is given, hits starting at or after it are skipped.
+    """
+
+    # NOTE: a multi-pattern engine (hyperscan, RE2 sets) could do this in a
+    # single pass, but neither supports the lookaheads in the ISBN patterns
+    # or the possessive quantifiers in the DOI patterns, so each pattern
+    # still gets its own pass here.
+    for id_type, literal, regexes in scan_plan(tuple(id_types)):
+        if literal and literal not in s:
+            continue
+        for regex in regexes:
+            for match in regex.finditer(s):
+                if stop is not None and match.start() >= stop:
+                    break
+                yield match.group(), id_type
+
+
+def parse_ids_from_chunks(
+    chunks: Iterable[tuple[str, int]], id_types: list[str] | None = None
 ) -> list[dict[str, str]]:
     """
-    Find all matches for the given id types in a string. If id_types isn't
+    Find all matches for the given id types in an iterable of (text, stop)
+    chunks, as produced by read_chunks, deduplicating across all of them. Only
+    hits starting before a chunk's stop offset are reported. If id_types isn't
     given, defaults to the types in id_patterns.
     """
 
@@ -123,48 +172,137 @@ def parse_ids_from_text(
     if id_types is None:
         id_types = list(id_patterns)
 
-    seen = set()
-    matches = []
-    for id_type in id_types:
-        for regex in id_patterns[id_type]:
+    # keyed by (id, type), this dedupes matches while keeping them in order
+    results: dict[tuple[str, str], None] = {}
+    for chunk, stop in chunks:
+        for key in scan_ids(chunk, id_types, stop):
+            if key in results:
+                continue
+            match, id_type = key
             validator = id_validators.get(id_type)
-            for match in re.findall(regex, s, re.IGNORECASE):
-                valid_id = validator(match) if validator else True
-                if match not in seen and valid_id:
-                    matches.append({"id": match, "type": id_type})
-                seen.add(match)
-    return matches
+            if validator and not validator(match):
+                continue
+            results[key] = None
+    return [{"id": match, "type": id_type} for match, id_type in results]
+
+
+def parse_ids_from_text(
+    s: str, id_types: list[str] | None = None
+) -> list[dict[str, str]]:
+    """
+    Find all matches for the given id types in a string. If id_types isn't
+    given, defaults to the types in id_patterns.
+    """
+
+    return parse_ids_from_chunks([(s, len(s))], id_types)
+
+
+# whitespace that no id pattern can contain (unlike space, which ISBNs can),
+# so a line may be safely cut after any of these
+chunk_separators = "\t\r\f\v"
+
+# how many characters of a cut line are carried over into the next chunk. An id
+# that starts before the cut is reported whole from the first chunk as long as
+# it's no longer than this
+chunk_overlap = 256
 
 
-def parse_file(path, id_types: list[str] | None = None):
+def read_chunks(
+    f, chunk_size: int = 1 << 20, max_line: int | None = None
+) -> Iterator[tuple[str, int]]:
+    """
+    Read an open text file in chunks of roughly chunk_size characters, yielding
+    (text, stop) pairs: only ids starting before stop belong to the chunk.
+    Chunks end on a line boundary, since none of the id patterns match across
+    a newline, so an identifier is never split between two chunks.
+
+    Lines longer than max_line (16 chunks by default) are cut after a
+    separator from chunk_separators if possible. Otherwise the last
+    chunk_overlap characters are scanned again as the start of the next
+    chunk, and the first chunk stops where the overlap begins, so an id
+    spanning the cut is reported once, from the first chunk. Only ids longer
+    than chunk_overlap can be reported truncated.
+    """
+
+    if max_line is None:
+        max_line = 16 * chunk_size
+
+    # the pieces read since the last line boundary
+    pending: list[str] = []
+    pending_len = 0
+    while data := f.read(chunk_size):
+        cut = data.rfind("\n") + 1
+        if cut:
+            pending.append(data[:cut])
+            buf = "".join(pending)
+            yield buf, len(buf)
+            rest = data[cut:]
+            pending = [rest] if rest else []
+            pending_len = len(rest)
+            continue
+
+        pending.append(data)
+        pending_len += len(data)
+        if pending_len < max_line:
+            continue
+
+        # no line boundary in sight, so cut the line in the back half
+        buf = "".join(pending)
+        start = len(buf) // 2
+        cut = max(buf.rfind(c, start) for c in chunk_separators) + 1
+        if cut:
+            yield buf[:cut], cut
+            rest = buf[cut:]
+        else:
+            yield buf, len(buf) - chunk_overlap
+            rest = buf[-chunk_overlap:]
+        pending = [rest]
+        pending_len = len(rest)
+
+    if pending_len:
+        buf = "".join(pending)
+        yield buf, len(buf)
+
+
+def parse_file(path, id_types: list[str] | None = None, chunk_size: int = 1 << 20):
     """
     Find all matches for the given id types in a file. If id_types isn't given,
-    defaults to the types in id_patterns.
+    defaults to the types in id_patterns. The file is read chunk_size
+    characters at a time rather than all at once.
     """
 
     matches = []
     try:
         with open(path) as f:
-            content = f.read()
-        matches = parse_ids_from_text(content, id_types)
+            matches = parse_ids_from_chunks(read_chunks(f, chunk_size), id_types)
     except Exception as e:
         print(f"Error: {e}")
 
     return matches
 
 
-def format_output(output: list[dict[str, str]], format: str = "raw") -> str:
+def format_lines(
+    output: Iterable[dict[str, str]], format: str = "raw"
+) -> Iterator[str]:
     """
-    Formats a list of dicts of ids and id types into a string according to the
-    given format type. 'raw' formats ids by line, ignoring type. 'jsonl' and
-    'csv' formats ids and types.
+    Lazily formats dicts of ids and id types into lines according to the given
+    format type. 'raw' formats ids by line, ignoring type. 'jsonl' and 'csv'
+    formats ids and types.
     """
 
-    lines: list[str] = []
     if format == "raw":
-        lines = [line["id"] for line in output]
+        return (line["id"] for line in output)
     elif format == "jsonl":
-        lines = [json.dumps(line) for line in output]
+        return (json.dumps(line) for line in output)
     elif format == "csv":
-        lines = [f"{line['id']},{line['type']}" for line in output]
-    return "\n".join(lines)
+        return (f"{line['id']},{line['type']}" for line in output)
+    return iter(())
+
+
+def format_output(output: Iterable[dict[str, str]], format: str = "raw") -> str:
+    """
+    Formats a list of dicts of ids and id types into a string according to the
+    given format type. See format_lines.
+    """
+
+    return "\n".join(format_lines(output, format))
@@ -0,0 +1,36 @@
+import re
+
+# these are the currently supported identifier types that we can parse, along
+# with their regex patterns
+id_patterns = {
+    # These come from https://gist.github.com/oscarmorrison/3744fa216dcfdb3d0bcb
+    "isbn": [
+        r"(?:ISBN(?:-10)?:?\ )?(?=[0-9X]{10}|(?=(?:[0-9]+[-\ ]){3})[-\ 0-9X]{13})[0-9]{1,5}[-\ ]?[0-9]+[-\ ]?[0-9]+[-\ ]?[0-9X]",
+        r"(?:ISBN(?:-13)?:?\ )?(?=[0-9]{13}|(?=(?:[0-9]+[-\ ]){4})[-\ 0-9]{17})97[89][-\ ]?[0-9]{1,5}[-\ ]?[0-9]+[-\ ]?[0-9]+[-\ ]?[0-9]",
+    ],
+    # doi regexes taken from https://www.crossref.org/blog/dois-and-matching-regular-expressions/
+    # listed in decreasing order of goodness. Not fully tested yet. Literal
+    # dots are escaped, and runs that are followed by a delimiter are
+    # possessive so a failed match can't backtrack through them.
+    "doi": [
+        r"10\.\d{4,9}/[-._;()/:A-Z0-9]+",
+        r"10\.1002/\S+",
+        # the original \d+X?(\d+)\d+ backtracks in cubic time on long digit
+        # runs; this is the same language: digits, X, 2+ digits; or 3+ digits
+        r"10\.\d{4}/\d++-(?:\d++X\d{2,}+|\d{3,}+)<\w++:\w*+>\d++\.\d++\.\w++;\d",
+        r"10\.1021/\w\w\d++",
+        r"10\.1207/\w++&\d++_\d++",
+    ],
+}
+
+# the patterns above, compiled once at import time
+compiled_id_patterns = {
+    id_type: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+    for id_type, patterns in id_patterns.items()
+}
+
+# literals that every pattern of an id type must contain. If a string doesn't
+# contain the literal, none of that type's patterns can match it.
+id_literals = {
+    "doi": "10.",
+}
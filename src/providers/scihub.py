@@ -1,13 +1,19 @@
 import asyncio
 import enum
+import json
 import logging
+import os
 import re
+import tempfile
+import time
 from urllib.parse import urljoin
 
 import aiohttp
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 from parse.parse import find_pdf_url
 
+logger = logging.getLogger(__name__)
+
 # URL-DIRECT - openly accessible paper
 # URL-NON-DIRECT - pay-walled paper
 # PMID - PubMed ID
@@ -17,41 +23,107 @@ IDClass = enum.Enum("identifier", ["URL-DIRECT", "URL-NON-DIRECT", "PMD", "DOI"]
 DEFAULT_USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.3 Safari/605.1.15"
 
 
+# where the list of available Sci-Hub urls is cached between runs, and for how
+# many seconds it's considered fresh
+SCIHUB_URLS_CACHE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "papers-dl",
+    "scihub_urls.json",
+)
+SCIHUB_URLS_TTL = 24 * 60 * 60
+
+# how long to wait on a single Sci-Hub mirror before giving up on it, so a dead
+# mirror doesn't hold up the others
+MIRROR_TIMEOUT = aiohttp.ClientTimeout(total=8, sock_connect=4)
+
+scihub_domain = re.compile(r"^https?://sci[-.]?hub", flags=re.IGNORECASE)
+
+
 class IdentifierNotFoundError(Exception):
     pass
 
 
-async def get_available_scihub_urls() -> list[str]:
+def _load_cached_urls(ttl: int = SCIHUB_URLS_TTL) -> list[str] | None:
     """
-    Finds available Sci-Hub urls via https://sci-hub.now.sh/
+    Load the cached list of Sci-Hub urls, or None if there isn't one or it's
+    older than ttl seconds.
     """
+    try:
+        if time.time() - os.path.getmtime(SCIHUB_URLS_CACHE) > ttl:
+            return None
+        with open(SCIHUB_URLS_CACHE) as f:
+            urls = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return urls or None
+
+
+def _store_cached_urls(urls: list[str]):
+    """
+    Save the list of Sci-Hub urls for later runs. The list is written to a
+    temporary file and moved into place, so concurrent readers and writers
+    never see a partially written cache.
+    """
+    cache_dir = os.path.dirname(SCIHUB_URLS_CACHE)
+    tmp_path = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=cache_dir)
+        with os.fdopen(fd, "w") as f:
+            json.dump(urls, f)
+        os.replace(tmp_path, SCIHUB_URLS_CACHE)
+    except OSError as e:
+        logger.info("Couldn't cache Sci-Hub urls: %s", e)
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+async def get_available_scihub_urls(refresh: bool = False) -> list[str]:
+    """
+    Finds available Sci-Hub urls via https://sci-hub.now.sh/. Results are
+    cached on disk for a day, unless refresh is set.
+    """
+
+    if not refresh:
+        cached_urls = _load_cached_urls()
+        if cached_urls:
+            return cached_urls
 
     # NOTE: This misses some valid URLs. Alternatively, we could parse
     # the HTML more finely by navigating the parsed DOM, instead of relying
     # on filtering. That might be more brittle in case the HTML changes.
     # Generally, we don't need to get all URLs.
-    scihub_domain = re.compile(r"^http[s]*://sci.hub", flags=re.IGNORECASE)
-    urls = []
-
     async with aiohttp.request("GET", "https://sci-hub.now.sh/") as res:
-        s = BeautifulSoup(await res.text(), "html.parser")
-    text_matches = s.find_all(
-        "a",
-        href=True,
-        string=re.compile(scihub_domain),
-    )
-    href_matches = s.find_all(
-        "a",
-        re.compile(scihub_domain),
-        href=True,
-    )
-    full_match_set = set(text_matches) | set(href_matches)
-    for a in full_match_set:
-        if "sci" in a or "sci" in a["href"]:
-            urls.append(a["href"])
+        tree = LexborHTMLParser(await res.text())
+    urls = [
+        a.attributes["href"]
+        for a in tree.css("a[href]")
+        if scihub_domain.match(a.attributes["href"] or "")
+    ]
+
+    if urls:
+        _store_cached_urls(urls)
     return urls
 
 
+async def _get_mirror_pages(session, identifier: str, base_urls: list[str]) -> list:
+    "Request the page for an identifier from each Sci-Hub mirror"
+
+    async def get_wrapper(url):
+        try:
+            return await session.get(url, timeout=MIRROR_TIMEOUT)
+        except Exception as e:
+            logger.error("error: %s", e)
+            return None
+
+    async with asyncio.TaskGroup() as tg:
+        tasks = [
+            tg.create_task(get_wrapper(urljoin(base_url, identifier)))
+            for base_url in base_urls
+        ]
+    return [task.result() for task in tasks]
+
+
 async def get_direct_urls(
     session,
     identifier: str,
@@ -60,32 +132,25 @@ async def get_direct_urls(
     """
     Finds the direct source url for a given identifier.
     """
+    if classify(identifier) == IDClass["URL-DIRECT"]:
+        return [identifier]
+
+    use_available_urls = base_urls is None
     if base_urls is None:
         base_urls = await get_available_scihub_urls()
 
-    async def get_wrapper(url):
-        try:
-            return await session.get(url)
-        except Exception as e:
-            logging.error("error: %s" % e)
-            return None
-
-    if classify(identifier) == IDClass["URL-DIRECT"]:
-        return [identifier]
+    responses = await _get_mirror_pages(session, identifier, base_urls)
 
-    async with asyncio.TaskGroup() as tg:
-        tasks = [
-            tg.create_task(get_wrapper(urljoin(base_url, identifier)))
-            for base_url in base_urls
-        ]
+    # if none of the cached mirrors respond, the cache is probably stale
+    if use_available_urls and not any(responses):
+        base_urls = await get_available_scihub_urls(refresh=True)
+        responses = await _get_mirror_pages(session, identifier, base_urls)
 
     direct_urls = []
-    # for item in zip(base_urls, tasks):
-    for task in tasks:
-        res = await task
+    for res in responses:
         if res is None:
             continue
-        path = find_pdf_url(await res.text())
+        path = find_pdf_url(await res.read())
         if isinstance(path, list):
             path = path[0]
         if isinstance(path, str) and path.startswith("//"):
@@ -97,7 +162,7 @@ async def get_direct_urls(
     if not direct_urls:
         raise IdentifierNotFoundError
 
-    logging.info(f"Found potential sources: {direct_urls}")
+    logger.info("Found potential sources: %s", direct_urls)
     return list(set(direct_urls))
 
 
@@ -1,3 +1,4 @@
+import io
 import os
 import unittest
 
@@ -47,6 +48,71 @@ class TestParser(unittest.TestCase):
                     f"ID {expected_id} not found in {file}",
                 )
 
+    def test_parse_file_chunked(self):
+        "Test that reading a file in small chunks finds the same identifiers."
+
+        for file in test_document_ids:
+            path = os.path.join(TestParser.test_material_dir, file)
+            with open(path) as f:
+                expected = parse.parse_ids_from_text(f.read())
+
+            chunked = parse.parse_file(path, chunk_size=64)
+
+            self.assertCountEqual(
+                [result["id"] for result in chunked],
+                [result["id"] for result in expected],
+                f"chunked parse of {file} differs",
+            )
+
+    def test_read_chunks_long_line(self):
+        "Test that lines longer than max_line are cut without losing ids."
+
+        # one long line with no separators, so it has to be hard cut
+        doi = "10.1109/83.544569"
+        content = ("x" * 1000 + " " + doi + " ") * 5
+
+        chunks = list(parse.read_chunks(io.StringIO(content), 64, max_line=512))
+        self.assertTrue(all(len(chunk) <= 512 + 64 for chunk, _ in chunks))
+
+        # shift the input across a whole chunk so the DOI straddles a cut, and
+        # check it's only ever reported whole
+        for shift in range(0, 576, 5):
+            shifted = "x" * shift + content
+            chunks = parse.read_chunks(io.StringIO(shifted), 64, max_line=512)
+            parsed_results = parse.parse_ids_from_chunks(chunks, ["doi"])
+            self.assertEqual([result["id"] for result in parsed_results], [doi])
+
+    def test_valid_isbn(self):
+        "Test ISBN check digit validation."
+
+        for isbn in ("0-306-40615-2", "ISBN-13: 978-1-60198-482-1", "080442957X"):
+            self.assertTrue(parse.valid_isbn(isbn), isbn)
+        for isbn in ("0-306-40615-3", "978-1-60198-482-2", "0804429579"):
+            self.assertFalse(parse.valid_isbn(isbn), isbn)
+
+    def test_parse_grouped_pattern(self):
+        "Test that patterns with groups return the whole match."
+
+        sici = "10.1234/1234-5678X901<ab:c>1.2.x;3"
+        parsed_results = parse.parse_ids_from_text(f"see {sici} here", ["doi"])
+        self.assertIn(sici, [result["id"] for result in parsed_results])
+
+    def test_is_doi(self):
+        "Test checking whether an identifier is a DOI."
+
+        for doi in (
+            "10.1016/j.cub.2019.11.030",
+            "10.1109/HPCA.2006.1598111",
+            "10.1002/(SICI)1097-4571(199806)49:8<693::AID-ASI4>3.0.CO;2-0",
+        ):
+            self.assertTrue(parse.is_doi(doi), doi)
+        for not_doi in (
+            "10.1016",
+            "https://doi.org/10.1016/j.cub.2019.11.030",
+            "10.12/ab",
+        ):
+            self.assertFalse(parse.is_doi(not_doi), not_doi)
+
 
 test_document_ids = {
     "ids.txt": {
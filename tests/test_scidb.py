@@ -18,3 +18,9 @@ class TestSciDB(unittest.TestCase):
                 html_content = f.read()
                 pdf_url = find_pdf_url(html_content)
             self.assertEqual(pdf_url, expected_url)
+
+    def test_find_pdf_in_html_bytes(self):
+        for file, expected_url in test_cases:
+            with open(file, "rb") as f:
+                pdf_url = find_pdf_url(f.read())
+            self.assertEqual(pdf_url, expected_url)